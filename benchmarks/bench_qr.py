@@ -0,0 +1,80 @@
+"""Times /qr rendering: the in-process encoder (cold and cached) against the old
+api.qrserver.com round trip.
+
+    python benchmarks/bench_qr.py [--rounds N] [--no-remote]
+
+The remote path is skipped (and reported as such) when the host can't reach it.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+PAYLOADS = {
+    "short URL": "https://example.com",
+    "typical URL": "https://github.com/PC0staS/utilsbot/blob/main/Readme.md",
+    "180-byte URL": "https://example.com/" + "a" * 160,
+}
+
+
+def _report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {label:<22} median {statistics.median(samples) * 1000:8.3f} ms   p95 {p95 * 1000:8.3f} ms")
+
+
+def _remote(url: str) -> bytes:
+    """What /qr did before: one HTTPS request to api.qrserver.com per call."""
+    qr_url = f"https://api.qrserver.com/v1/create-qr-code/?data={urllib.parse.quote(url)}&size=200x200"
+    return urllib.request.urlopen(qr_url, timeout=20).read()
+
+
+async def main(rounds: int, remote: bool) -> None:
+    for name, url in PAYLOADS.items():
+        code = bot.QRCode(url.encode(), "M")
+        print(f"{name} ({len(url)} bytes, version {code.version}):")
+
+        cold = []
+        for i in range(rounds):
+            bot.qr_cache = bot.TTLCache("qr", maxsize=256, ttl=float("inf"))
+            t0 = time.perf_counter()
+            await bot.render_qr(url, "M", 200, "png")
+            cold.append(time.perf_counter() - t0)
+        _report("local, cold", cold)
+
+        cached = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            await bot.render_qr(url, "M", 200, "png")
+            cached.append(time.perf_counter() - t0)
+        _report("local, cached", cached)
+
+        if not remote:
+            continue
+        samples = []
+        try:
+            for _ in range(min(rounds, 10)):
+                t0 = time.perf_counter()
+                await asyncio.to_thread(_remote, url)
+                samples.append(time.perf_counter() - t0)
+        except Exception as e:
+            print(f"  {'remote (qrserver)':<22} unavailable: {e}")
+            remote = False
+        else:
+            _report("remote (qrserver)", samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--no-remote", action="store_true", help="skip the api.qrserver.com baseline")
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds, not args.no_remote))
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Keep outputs out of the real Nextcloud folder; must be set before bot is imported
+os.environ.setdefault("NEXTCLOUD_DIR", tempfile.mkdtemp(prefix="utilsbot-tests-"))
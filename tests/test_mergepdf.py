@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from conftest import ROOT
+
+import bot
+
+INPUTS = 5
+INPUT_BYTES = 20_000_000  # the 5x20 MB merge from the original report
+
+
+def make_pdf(path: Path, pages: int, page_bytes: int) -> None:
+    """Writes a plain PDF whose pages carry incompressible content streams."""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    for i in range(pages):
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R >>".encode())
+        content = b"% " + os.urandom(page_bytes // 2).hex().encode()[: page_bytes - 3] + b"\n"
+        objs.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    with path.open("wb") as fh:
+        fh.write(b"%PDF-1.4\n")
+        offsets = []
+        for n, obj in enumerate(objs, 1):
+            offsets.append(fh.tell())
+            fh.write(b"%d 0 obj\n" % n + obj + b"\nendobj\n")
+        xref = fh.tell()
+        fh.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+        for off in offsets:
+            fh.write(b"%010d 00000 n \n" % off)
+        fh.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref))
+
+
+# Runs in a fresh interpreter so ru_maxrss only reflects the merge itself
+CHILD = textwrap.dedent("""
+    import resource, sys
+    from pathlib import Path
+    import psutil
+    sys.path.insert(0, sys.argv[1])
+    import bot
+    base = psutil.Process().memory_info().rss
+    bot._merge_pdf_files([Path(p) for p in sys.argv[3:]], Path(sys.argv[2]))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(peak - base)
+""")
+
+
+def test_merge_peak_rss_stays_near_input_size(tmp_path):
+    inputs = []
+    for i in range(INPUTS):
+        path = tmp_path / f"in{i}.pdf"
+        make_pdf(path, pages=10, page_bytes=INPUT_BYTES // 10)
+        inputs.append(path)
+    total = sum(p.stat().st_size for p in inputs)
+    output = tmp_path / "merged.pdf"
+
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, str(ROOT), str(output), *map(str, inputs)],
+        capture_output=True, text=True, timeout=300, env={**os.environ},
+    )
+    assert proc.returncode == 0, proc.stderr
+    growth = int(proc.stdout.split()[-1])
+
+    from pypdf import PdfReader  # type: ignore
+
+    with output.open("rb") as fh:
+        assert len(PdfReader(fh).pages) == INPUTS * 10
+    # Documented on _merge_pdf_files: ~1x the total input (the old BytesIO path was ~4x)
+    assert growth < 1.5 * total, f"peak RSS grew {growth >> 20} MB for {total >> 20} MB of input"
+
+
+def test_check_pdf_counts_pages_and_rejects_passwords(tmp_path):
+    from pypdf import PdfWriter  # type: ignore
+
+    plain = tmp_path / "plain.pdf"
+    make_pdf(plain, pages=3, page_bytes=1000)
+    assert bot._check_pdf(plain, 1) == 3
+
+    writer = PdfWriter(clone_from=str(plain))
+    writer.encrypt("secret")
+    locked = tmp_path / "locked.pdf"
+    writer.write(str(locked))
+    with pytest.raises(bot.PdfProtectedError) as exc:
+        bot._check_pdf(locked, 2)
+    assert exc.value.index == 2
+    with pytest.raises(bot.PdfProtectedError):
+        bot._merge_pdf_files([plain, locked], tmp_path / "merged.pdf")
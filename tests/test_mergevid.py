@@ -0,0 +1,74 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+import bot
+
+
+def probe(v_codec="h264", a_codec="aac", width=1280, container="mov,mp4,m4a,3gp,3g2,mj2") -> bot.VideoProbe:
+    return bot.VideoProbe(
+        path=Path("in.mp4"), container=container, duration=10.0, v_codec=v_codec,
+        width=width, height=720, pix_fmt="yuv420p", fps="30/1", time_base="1/15360",
+        a_codec=a_codec, sample_rate=48000 if a_codec else None, channels=2 if a_codec else None,
+    )
+
+
+@pytest.fixture(autouse=True)
+def all_encoders(monkeypatch):
+    # available=None means "not detected yet", where has() accepts any encoder
+    monkeypatch.setattr(bot.transcoder, "available", None)
+
+
+def test_identical_inputs_copy():
+    assert bot.plan_concat([probe(), probe()]).strategy == "copy"
+
+
+def test_odd_input_is_normalized():
+    plan = bot.plan_concat([probe(), probe(), probe(width=640)])
+    assert plan.strategy == "normalize"
+    assert plan.actions == {2: "reencode"}
+    args = bot._normalize_args(probe(width=640), "reencode", plan, Path("out.mp4"), bot.transcoder.profile("speed"))
+    assert "libx264" in args and "aac" in args
+
+
+@pytest.mark.parametrize("v_codec", ["vp9", "av1"])
+def test_video_codec_without_encoder_reencodes(v_codec):
+    plan = bot.plan_concat([probe(v_codec), probe(v_codec), probe(v_codec, width=640)])
+    assert plan.strategy == "reencode"
+
+
+@pytest.mark.parametrize("a_codec", ["vorbis", "flac"])
+def test_audio_codec_without_encoder_reencodes(a_codec):
+    plan = bot.plan_concat([probe(a_codec=a_codec), probe(a_codec=a_codec), probe(a_codec=None)])
+    assert plan.strategy == "reencode"
+
+
+def test_missing_encoder_reencodes(monkeypatch):
+    monkeypatch.setattr(bot.transcoder, "available", {"aac"})
+    plan = bot.plan_concat([probe(), probe(), probe(width=640)])
+    assert plan.strategy == "reencode"
+
+
+def test_run_ffmpeg_kills_process_when_cancelled(monkeypatch):
+    spawned = []
+    spawn = asyncio.create_subprocess_exec
+
+    async def spy(*args, **kwargs):
+        spawned.append(await spawn(*args, **kwargs))
+        return spawned[-1]
+
+    monkeypatch.setattr(bot.asyncio, "create_subprocess_exec", spy)
+
+    async def main():
+        # Any long-running process stands in for ffmpeg
+        task = asyncio.create_task(bot._run_ffmpeg([sys.executable, "-c", "import time; time.sleep(60)"]))
+        while not spawned:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert spawned[0].returncode is not None
@@ -0,0 +1,160 @@
+import asyncio
+import zlib
+
+import pytest
+
+import bot
+
+# ISO/IEC 18004 table C.1: format information (after the 0x5412 mask) per level, masks 0-7
+FORMAT_BITS = {
+    "L": ("111011111000100", "111001011110011", "111110110101010", "111100010011101",
+          "110011000101111", "110001100011000", "110110001000001", "110100101110110"),
+    "M": ("101010000010010", "101000100100101", "101111001111100", "101101101001011",
+          "100010111111001", "100000011001110", "100111110010111", "100101010100000"),
+    "Q": ("011010101011111", "011000001101000", "011111100110001", "011101000000110",
+          "010010010110100", "010000110000011", "010111011011010", "010101111101101"),
+    "H": ("001011010001001", "001001110111110", "001110011100111", "001100111010000",
+          "000011101100010", "000001001010101", "000110100001100", "000100000111011"),
+}
+
+# ISO/IEC 18004 table D.1: version information for versions 7-10
+VERSION_BITS = {7: 0x07C94, 8: 0x085BC, 9: 0x09A99, 10: 0x0A4D3}
+
+# Final matrices, one hex string per row (dark = 1). Cross-checked against segno 1.6.6
+# with the same mask; the payloads fill every data codeword, so no pad codewords are
+# involved (segno emits an extra zero byte before them).
+MATRICES = [
+    (b"ABCDEFGHIJKLMNOPQ", "L", 1, 6, [
+        "1fdd7f", "104341", "17465d", "174e5d", "174b5d", "104d41", "1fd57f", "001000", "1b4e41",
+        "158515", "13f54b", "0219a6", "1440df", "001987", "1fc318", "1045cf", "175c4d", "175b56",
+        "17459f", "10526f", "1fd094",
+    ]),
+    # Version 5-Q: two block lengths (15 and 16 data codewords) interleaved
+    ((bytes(range(0x61, 0x61 + 26)) * 3)[:60], "Q", 5, 2, [
+        "1fdc832d7f", "104b6eca41", "17451a855d", "174a364e5d", "175958a15d", "10566f8341",
+        "1fd555557f", "000f26e500", "0fed307e31", "0d959aa9a0", "1f7c3592fb", "0aae74b061",
+        "0541127cd7", "10b4fae12a", "0648344e73", "199a41b4a2", "13cbbc7dfe", "0a9a682da8",
+        "12fbb0d71b", "0d2f54c341", "1940ab5ed6", "152fada122", "125b0d1a33", "1f3733a142",
+        "15669b6ffd", "1b329aa9a0", "16797783d3", "10a404d6e2", "1176837df5", "0010fdeb18",
+        "1fdea5515f", "1056e9f110", "1753c07ffe", "175114acda", "175b740721", "105940b5d1",
+        "1fc7af5c67",
+    ]),
+    # Version 7-Q: alignment pattern grid and version information blocks
+    ((b"https://github.com/PC0staS/utilsbot?" * 3)[:86], "Q", 7, 4, [
+        "1fcc4797c17f", "104e8d331241", "175db1c99a5d", "17418e89635d", "1754adf7cf5d",
+        "105dbb1b9841", "1fd55555557f", "00011d10d300", "095611f25cb4", "1c9da7acdb48",
+        "02513b1f53d6", "120f00529aca", "13c0dfbc9721", "1a214d37e346", "09e390f3f958",
+        "01151e9859e1", "09e0978e56eb", "10a2ae0cc142", "19c4c50e79da", "1a32c2c0fe61",
+        "03f65ffad3f9", "0712031cfb12", "095551524f5a", "1d182b1ed313", "0bf751fadff8",
+        "0a8e1dfdcb68", "1ddbe9a3728c", "19078fa614d3", "0175b35058d3", "043820e6cb6e",
+        "04d27128fa98", "0104f7a415a1", "024d92fa59d2", "05aa52c8f8e8", "01534f3d6286",
+        "0f1c320151f3", "134b07fabdf0", "0018b91ae316", "1fcead5bc956", "104fc11eb312",
+        "1754f3f6bdf9", "1749bc7cf0fd", "1746c31dea1a", "1059feba3cb0", "1fc1b3ba7e29",
+    ]),
+]
+
+# ISO/IEC 18004:2015 7.8.3 penalty of the first matrix above under each mask, as scored
+# by segno's evaluate_mask
+PENALTIES = (1043, 1127, 1047, 1096, 1128, 1105, 1036, 1086)
+
+
+def rows(qr: bot.QRCode) -> list[str]:
+    return ["".join("1" if m else "0" for m in row) for row in qr.modules]
+
+
+def test_reed_solomon_known_vectors():
+    # 1-M "HELLO WORLD" (alphanumeric) and the ISO/IEC 18004 annex I "01234567" example
+    hello = [32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17, 236, 17, 236, 17]
+    assert bot._rs_remainder(hello, 10) == [196, 35, 39, 119, 235, 215, 231, 226, 93, 23]
+    digits = [16, 32, 12, 86, 97, 128, 236, 17, 236, 17, 236, 17, 236, 17, 236, 17]
+    assert bot._rs_remainder(digits, 10) == [165, 36, 212, 193, 237, 54, 199, 135, 44, 85]
+
+
+def test_reed_solomon_generator():
+    # Annex A: g(x) for 7 ECC codewords has exponents 87, 229, 146, 149, 238, 102, 21
+    gen = bot._rs_generator(7)
+    assert [bot._GF_LOG[c] for c in gen] == [87, 229, 146, 149, 238, 102, 21]
+
+
+def test_data_codewords_with_padding():
+    # 0100 | 00001000 | "http://a" | 0000 terminator, then 0xEC 0x11 pad codewords
+    qr = bot.QRCode(b"http://a", "L")
+    assert qr.version == 1
+    words = qr._codewords(b"http://a", bot.QR_LEVELS.index("L"), 8)
+    assert words[:19] == [
+        0x40, 0x86, 0x87, 0x47, 0x47, 0x03, 0xA2, 0xF2, 0xF6, 0x10,
+        0xEC, 0x11, 0xEC, 0x11, 0xEC, 0x11, 0xEC, 0x11, 0xEC,
+    ]
+    assert words[19:] == bot._rs_remainder(words[:19], 7)
+
+
+@pytest.mark.parametrize("level", bot.QR_LEVELS)
+@pytest.mark.parametrize("mask", range(8))
+def test_format_bits(level, mask):
+    qr = bot.QRCode(b"format", level, mask=mask)
+    m, n = qr.modules, qr.size
+    near = [m[8][x] for x in (0, 1, 2, 3, 4, 5, 7, 8)] + [m[y][8] for y in (7, 5, 4, 3, 2, 1, 0)]
+    far = [m[y][8] for y in range(n - 1, n - 8, -1)] + [m[8][x] for x in range(n - 8, n)]
+    expected = [c == "1" for c in FORMAT_BITS[level][mask]]
+    assert near == expected
+    assert far == expected
+    assert m[n - 8][8]  # the dark module
+
+
+@pytest.mark.parametrize("version", sorted(VERSION_BITS))
+def test_version_bits(version):
+    capacity = bot._qr_data_codewords(version, bot.QR_LEVELS.index("L"))
+    header = 2 if version < 10 else 3  # mode + character count (8 or 16 bits) + terminator
+    qr = bot.QRCode(b"v" * (capacity - header), "L")
+    assert qr.version == version
+    n = qr.size
+    top_right = sum(qr.modules[i // 3][n - 11 + i % 3] << i for i in range(18))
+    bottom_left = sum(qr.modules[n - 11 + i % 3][i // 3] << i for i in range(18))
+    assert top_right == bottom_left == VERSION_BITS[version]
+
+
+@pytest.mark.parametrize("data,level,version,mask,expected", MATRICES)
+def test_known_matrices(data, level, version, mask, expected):
+    qr = bot.QRCode(data, level)
+    assert (qr.version, qr.mask) == (version, mask)
+    width = qr.size
+    assert rows(qr) == [format(int(h, 16), f"0{width}b") for h in expected]
+
+
+def test_penalty_and_mask_choice():
+    data, level = MATRICES[0][:2]
+    scores = []
+    for mask in range(8):
+        qr = bot.QRCode(data, level, mask=mask)
+        scores.append(qr._penalty())
+    assert tuple(scores) == PENALTIES
+    assert bot.QRCode(data, level).mask == PENALTIES.index(min(PENALTIES))
+
+
+def test_capacity_limit():
+    bot.QRCode(b"x" * 2953, "L")  # version 40-L byte capacity
+    with pytest.raises(ValueError):
+        bot.QRCode(b"x" * 2954, "L")
+
+
+def test_png_output():
+    qr = bot.QRCode(b"https://example.com", "M")
+    png = qr.png(pixels=200)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height = int.from_bytes(png[16:20], "big"), int.from_bytes(png[20:24], "big")
+    scale = 200 // (qr.size + 8)
+    assert width == height == scale * (qr.size + 8)
+    raw = zlib.decompressobj().decompress(png[png.index(b"IDAT") + 4:])
+    # The quiet zone is 4 modules; the first module row starts below it
+    stride = width + 1
+    first = raw[4 * scale * stride:4 * scale * stride + stride]
+    assert first[0] == 0  # filter byte
+    assert first[1 + 4 * scale] == 0  # top-left finder module is dark
+
+
+def test_render_qr_caches(monkeypatch):
+    monkeypatch.setattr(bot, "qr_cache", bot.TTLCache("qr", maxsize=4, ttl=60))
+    first = asyncio.run(bot.render_qr("https://example.com", "M", 200, "svg"))
+    again = asyncio.run(bot.render_qr("https://example.com", "M", 200, "svg"))
+    assert first is again
+    assert first.startswith(b"<svg") or first.startswith(b"<?xml")
@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+
+import pytest
+from aiohttp import web
+
+import bot
+
+RDAP_RECORD = {
+    "objectClassName": "domain",
+    "ldhName": "example.test",
+    "status": ["client transfer prohibited", "active"],
+    "events": [
+        {"eventAction": "registration", "eventDate": "1995-08-14T04:00:00Z"},
+        {"eventAction": "expiration", "eventDate": "2030-08-13T04:00:00Z"},
+        {"eventAction": "last changed", "eventDate": "2024-08-14T07:01:34Z"},
+    ],
+    "entities": [
+        {"roles": ["technical"], "handle": "TECH-1"},
+        {
+            "roles": ["registrar"],
+            "handle": "376",
+            "vcardArray": ["vcard", [["version", {}, "text", "4.0"], ["fn", {}, "text", "Stub Registrar, Inc."]]],
+        },
+    ],
+    "nameservers": [{"ldhName": "B.NS.EXAMPLE.TEST"}, {"ldhName": "a.ns.example.test"}],
+}
+
+WHOIS_RECORD = """\
+% Stub WHOIS server
+Domain Name: EXAMPLE.WTLD
+Registrar: Stub Registrar, Inc.  (IANA 376)
+Creation Date: 1995-08-14T04:00:00Z
+Registry Expiry Date: 2030-08-13T04:00:00Z
+Updated Date: 2024-08-14T07:01:34Z
+Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+Name Server: NS2.EXAMPLE.WTLD.
+Name Server: ns1.example.wtld
+>>> Last update of whois database: 2024-10-01T00:00:00Z <<<
+"""
+
+UK_RECORD = """\
+    Domain name:
+        example.co.uk
+
+    Registrar:
+        Stub Registrar Ltd [Tag = STUB]
+
+    Relevant dates:
+        Registered on: 26-Aug-1996
+        Expiry date:  26-Aug-2030
+
+    Name servers:
+        ns1.example.co.uk
+        ns2.example.co.uk   192.0.2.1
+"""
+
+
+def run(coro):
+    """Runs a test coroutine with the shared HTTP session, which is bound to its loop."""
+    async def _main():
+        await bot.http_client.start()
+        try:
+            return await coro
+        finally:
+            await bot.http_client.close()
+
+    return asyncio.run(_main())
+
+
+@contextlib.asynccontextmanager
+async def whois_stub(replies: dict[str, str], delay: float = 0.0):
+    """Local RFC 3912 server answering each query from replies; yields (host:port, queries)."""
+    queries: list[str] = []
+
+    async def handle(reader, writer):
+        query = (await reader.readline()).decode().strip()
+        queries.append(query)
+        await asyncio.sleep(delay)
+        writer.write(replies.get(query, "No match for domain.\r\n").encode())
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        yield f"127.0.0.1:{port}", queries
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@contextlib.asynccontextmanager
+async def rdap_stub(tlds: list[str], records: dict[str, dict]):
+    """Local RDAP service plus bootstrap file; yields (base URL, request paths)."""
+    requests: list[str] = []
+
+    async def bootstrap(request):
+        requests.append(request.path)
+        base = f"http://{request.host}/rdap/"
+        return web.json_response({"services": [[tlds, [base]]]})
+
+    async def domain(request):
+        requests.append(request.path)
+        record = records.get(request.match_info["name"])
+        if record is None:
+            return web.json_response({"errorCode": 404}, status=404)
+        return web.json_response(record)
+
+    app = web.Application()
+    app.router.add_get("/dns.json", bootstrap)
+    app.router.add_get("/rdap/domain/{name}", domain)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}", requests
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(bot, "whois_servers", bot.TTLCache("whois-servers", maxsize=64, ttl=3600))
+    monkeypatch.setattr(bot, "whois_cache", bot.TTLCache("whois", maxsize=64, ttl=3600))
+    monkeypatch.setattr(bot, "WHOIS_TIMEOUT", 2.0)
+
+
+def test_parse_rdap():
+    r = bot._parse_rdap("example.test", RDAP_RECORD, "https://rdap.example/")
+    assert r.source == "RDAP rdap.example"
+    assert r.registrar == "Stub Registrar, Inc."
+    assert (r.created, r.expires, r.updated) == ("1995-08-14", "2030-08-13", "2024-08-14")
+    assert r.status == ("client transfer prohibited", "active")
+    assert r.nameservers == ("a.ns.example.test", "b.ns.example.test")
+
+
+def test_parse_whois_key_value():
+    r = bot._parse_whois("example.wtld", WHOIS_RECORD, "whois.stub")
+    assert r.source == "WHOIS whois.stub"
+    assert r.registrar == "Stub Registrar, Inc."
+    assert (r.created, r.expires, r.updated) == ("1995-08-14", "2030-08-13", "2024-08-14")
+    assert r.status == ("clientTransferProhibited",)
+    assert r.nameservers == ("ns1.example.wtld", "ns2.example.wtld")
+
+
+def test_parse_whois_indented_values():
+    r = bot._parse_whois("example.co.uk", UK_RECORD, "whois.nic.uk")
+    assert r.registrar == "Stub Registrar Ltd [Tag = STUB]"
+    assert r.nameservers == ("ns1.example.co.uk", "ns2.example.co.uk")
+
+
+def test_parse_whois_not_registered():
+    with pytest.raises(LookupError, match="not registered"):
+        bot._parse_whois("free.wtld", "No match for domain \"FREE.WTLD\".\n", "whois.stub")
+    with pytest.raises(LookupError, match="Could not parse"):
+        bot._parse_whois("odd.wtld", "something unexpected\n", "whois.stub")
+
+
+def test_lookup_domain_rdap(monkeypatch):
+    async def main():
+        async with rdap_stub(["test"], {"example.test": RDAP_RECORD}) as (base, requests):
+            monkeypatch.setattr(bot, "RDAP_BOOTSTRAP_URL", f"{base}/dns.json")
+            first = await bot.lookup_domain("https://Example.TEST/path")
+            again = await bot.lookup_domain("example.test")
+            with pytest.raises(LookupError, match="not registered"):
+                await bot.lookup_domain("missing.test")
+            return first, again, requests
+
+    first, again, requests = run(main())
+    assert first is again
+    assert first.registrar == "Stub Registrar, Inc."
+    assert first.source == "RDAP 127.0.0.1"
+    # Bootstrap fetched once; the cached record isn't requested again
+    assert requests == ["/dns.json", "/rdap/domain/example.test", "/rdap/domain/missing.test"]
+
+
+def test_lookup_domain_whois_referral(monkeypatch):
+    async def main():
+        async with whois_stub({"example.wtld": WHOIS_RECORD, "other.wtld": WHOIS_RECORD}) as (registry, seen):
+            async with whois_stub({"wtld": f"domain: WTLD\nrefer: {registry}\n"}) as (iana, iana_seen):
+                async with rdap_stub(["test"], {}) as (base, _):
+                    monkeypatch.setattr(bot, "RDAP_BOOTSTRAP_URL", f"{base}/dns.json")
+                    monkeypatch.setattr(bot, "WHOIS_IANA_SERVER", iana)
+                    first = await bot.lookup_domain("example.wtld")
+                    second = await bot.lookup_domain("other.wtld")
+                    return first, second, seen, iana_seen, registry
+
+    first, second, seen, iana_seen, registry = run(main())
+    assert first.registrar == "Stub Registrar, Inc."
+    assert first.source == f"WHOIS {registry}"
+    assert second.domain == "other.wtld"
+    # IANA is asked once per TLD; the registry server is remembered after that
+    assert iana_seen == ["wtld"]
+    assert seen == ["example.wtld", "other.wtld"]
+
+
+def test_lookup_domain_without_rdap_bootstrap(monkeypatch):
+    async def main():
+        async with whois_stub({"example.wtld": WHOIS_RECORD}) as (registry, _):
+            async with whois_stub({"wtld": f"whois: {registry}\n"}) as (iana, _):
+                # Nothing listens on port 9 here; the lookup falls back to WHOIS
+                monkeypatch.setattr(bot, "RDAP_BOOTSTRAP_URL", "http://127.0.0.1:9/dns.json")
+                monkeypatch.setattr(bot, "WHOIS_IANA_SERVER", iana)
+                return await bot.lookup_domain("example.wtld")
+
+    assert run(main()).source.startswith("WHOIS ")
+
+
+def test_lookup_domain_unknown_tld(monkeypatch):
+    async def main():
+        async with whois_stub({}) as (iana, _):
+            async with rdap_stub([], {}) as (base, _):
+                monkeypatch.setattr(bot, "RDAP_BOOTSTRAP_URL", f"{base}/dns.json")
+                monkeypatch.setattr(bot, "WHOIS_IANA_SERVER", iana)
+                await bot.lookup_domain("example.nowhere")
+
+    with pytest.raises(LookupError, match="No WHOIS or RDAP server"):
+        run(main())
+
+
+def test_whois_query_times_out(monkeypatch):
+    monkeypatch.setattr(bot, "WHOIS_TIMEOUT", 0.2)
+
+    async def main():
+        async with whois_stub({"example.wtld": WHOIS_RECORD}, delay=5) as (server, seen):
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            with pytest.raises(asyncio.TimeoutError):
+                await bot._whois_query(server, "example.wtld")
+            return loop.time() - started, seen
+
+    elapsed, seen = run(main())
+    assert seen == ["example.wtld"]
+    assert elapsed < 2
+
+
+def test_invalid_domain_rejected():
+    with pytest.raises(ValueError):
+        run(bot.lookup_domain("-h.test"))